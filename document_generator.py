@@ -4,196 +4,606 @@ import io
 import time
 import copy
 import logging
+import pickle
+import queue
 import re
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from docxtpl import DocxTemplate
+import sys
+import threading
+import zipfile
+from xml.sax.saxutils import escape as xml_escape
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from multiprocessing import shared_memory
 
 logger = logging.getLogger(__name__)
 
+# 文件名中的非法字符
+_ILLEGAL_FILENAME_CHARS = frozenset('<>:"/\\|?*')
+_ILLEGAL_FILENAME_RE = re.compile(r'[<>:"/\\|?*]+')
+
+# 可走快速替换路径的模板部件，以及其中的简单占位符 {{ 变量 }}
+_FAST_TEMPLATE_PART_RE = re.compile(r'word/(document|header\d*|footer\d*)\.xml$')
+_SIMPLE_PLACEHOLDER_RE = re.compile(r'\{\{\s*([^\W\d]\w*)\s*\}\}')
+# 值中含有这些字符时不能直接拼接，交由docxtpl渲染：\t \n \a \f 会被转换为制表符、换行、分段、分页，
+# 其余不属于XML 1.0合法字符的控制字符直接写入会生成无法打开的文档，由docxtpl丢弃
+_FAST_PATH_UNSAFE_CHARS_RE = re.compile('[^\r\x20-\ud7ff\ue000-\ufffd\U00010000-\U0010ffff]')
+# 与docxtpl的patch_xml相同：含占位符的文本节点加上xml:space="preserve"，保留值首尾的空格
+_PRESERVE_SPACE_RE = re.compile(r"<w:t>((?:(?!<w:t>).)*)({{.*?}}|{%.*?%})", re.DOTALL)
+
+# 每个工作进程中负责写入文档的线程数
+_WRITER_THREADS = 2
+
 
 def _sanitize_filename(filename, default_name):
     """清理文件名中的非法字符，并确保文件名不为空"""
     sanitized = str(filename).strip()
-    sanitized = re.sub(r'[<>:"/\\|?*]+', '_', sanitized)
+    if not _ILLEGAL_FILENAME_CHARS.isdisjoint(sanitized):
+        sanitized = _ILLEGAL_FILENAME_RE.sub('_', sanitized)
     if not sanitized:
         sanitized = default_name
     return sanitized
 
 
-def _unique_file_path(file_path):
-    """生成唯一的文件路径，如果文件已存在则添加数字后缀"""
-    if not os.path.exists(file_path):
-        return file_path
+def _cell_to_str(value):
+    """将单元格值转换为字符串，整数值的浮点数去掉小数部分"""
+    if type(value) is str:
+        return value
+    try:
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return str(value)
+    except Exception:
+        return ""
+
+
+def dataframe_to_rows(data_frame):
+    """将DataFrame一次性转换为字符串字典列表
+
+    按列向量化转换（规则与 _cell_to_str 相同），生成文档时无需再逐个单元格判断类型。
+    转换后的列数组直接按行zip成字典，不再重新构造DataFrame。
+    列名统一转为字符串（Excel中的数字表头读入后为int）。
+    """
+    import numpy as np
+    from pandas import StringDtype
+    from pandas.api.types import CategoricalDtype, infer_dtype
     
-    base_path, ext = os.path.splitext(file_path)
-    counter = 1
+    columns = [str(col) for col in data_frame.columns]
+    arrays = []
+    for col_pos in range(len(columns)):
+        series = data_frame.iloc[:, col_pos]
+        if series.dtype.kind == 'f':
+            values = series.to_numpy()
+            converted = values.astype(str).astype(object)
+            is_integer = (values == values.round()) & (abs(values) < float('inf'))
+            fits_int64 = is_integer & (abs(values) < 2 ** 63)
+            converted[fits_int64] = values[fits_int64].astype('int64').astype(str).astype(object)
+            for i in (is_integer & ~fits_int64).nonzero()[0]:
+                converted[i] = str(int(values[i]))
+        elif isinstance(series.dtype, CategoricalDtype):
+            # 分类列只转换不重复的类别，再按编码取值（编码-1表示空值）
+            categories = [_cell_to_str(value) for value in series.cat.categories]
+            lookup = np.array(categories + [_cell_to_str(float('nan'))], dtype=object)
+            converted = lookup[series.cat.codes.to_numpy()]
+        elif isinstance(series.dtype, StringDtype) and series.dtype.storage == 'pyarrow':
+            # Arrow字符串列直接由Arrow一次性转换为Python字符串列表，空值同样转换为'nan'
+            import pyarrow as pa
+            import pyarrow.compute as pc
+            converted = pc.fill_null(pa.array(series.array), 'nan').to_pylist()
+        elif series.dtype.kind in 'iub':
+            # 整数/布尔列转换后的字符串长度有限，可直接用numpy转换；空值统一按NaN转换
+            converted = series.to_numpy(dtype=object, na_value=float('nan')).astype(str).astype(object)
+        elif infer_dtype(series, skipna=True) == 'string':
+            # 字符串列本身就是str对象，只把空值替换为'nan'；不经过numpy定长字符串数组，
+            # 否则内存占用为行数乘以最长单元格的长度
+            converted = series.to_numpy(dtype=object, copy=True)
+            converted[series.isna().to_numpy()] = 'nan'
+        else:
+            converted = series.map(_cell_to_str).to_numpy(dtype=object)
+        arrays.append(converted)
     
-    while True:
-        new_file_path = f"{base_path}_{counter}{ext}"
-        if not os.path.exists(new_file_path):
-            return new_file_path
+    return [dict(zip(columns, values)) for values in zip(*arrays)]
+
+
+def _reserve_file_path(folder_path, file_name, folder_index):
+    """为文档预留一个未被占用的文件名，如果文件名已被占用则添加数字后缀
+
+    每个文件夹只列目录一次，已占用的文件名记录在folder_index中，无需逐个stat探测候选文件名。
+    在渲染线程中按行顺序调用，同名文件的编号顺序与数据行顺序一致，不受写入线程完成先后的影响。
+
+    Returns:
+        str: 预留的文件路径
+    """
+    used_names = folder_index.get(folder_path)
+    if used_names is None:
+        try:
+            used_names = set(os.listdir(folder_path))
+        except OSError:
+            used_names = set()
+        folder_index[folder_path] = used_names
+
+    base_name, ext = os.path.splitext(file_name)
+    candidate = file_name
+    counter = 0
+    while candidate in used_names:
         counter += 1
+        candidate = f"{base_name}_{counter}{ext}"
+    used_names.add(candidate)
+    return folder_path + os.sep + candidate
+
+
+def _write_reserved_file(folder_path, file_name, file_path, data, folder_index):
+    """以独占方式创建预留的文件并写入数据（在写入线程中执行）
+
+    独占创建由系统保证多个进程同时写入同一文件夹时不会互相覆盖；预留的文件名
+    已被其他进程占用时，再按原文件名顺延编号。
+
+    Returns:
+        str: 实际写入的文件路径
+    """
+    while True:
+        try:
+            with open(file_path, 'xb') as f:
+                f.write(data)
+            return file_path
+        except FileExistsError:
+            file_path = _reserve_file_path(folder_path, file_name, folder_index)
+
+
+def _get_folder_path(folder_name, output_prefix, folder_paths):
+    """返回文件夹的完整路径，同名文件夹只拼接一次
+
+    Args:
+        output_prefix: 以路径分隔符结尾的输出目录
+        folder_paths: 文件夹名到完整路径的缓存字典
+    """
+    folder_path = folder_paths.get(folder_name)
+    if folder_path is None:
+        folder_path = folder_paths[folder_name] = output_prefix + folder_name
+    return folder_path
+
+
+def _resolve_template_fields(template_mapping):
+    """预先计算模板匹配所需的字段列表
+
+    Returns:
+        list of (field, field_alias, mapping) tuples，按匹配优先级排列
+    """
+    if not template_mapping:
+        return []
+    if "__priority__" in template_mapping:
+        fields = [field for field in template_mapping["__priority__"] if field in template_mapping]
+    else:
+        fields = list(template_mapping.keys())
+    return [(field, field.replace(" ", "_"), template_mapping[field]) for field in fields]
+
+
+def _find_number_source_key(keys):
+    """确定"编号"字段的数据来源列
+
+    优先使用名为"编号"的列，否则使用第一个名称包含"编号"、"num"或"id"的列。
+    同一批数据的列相同，只需计算一次。
+    """
+    keys = list(keys)
+    if "编号" in keys:
+        return "编号"
+    for field in keys:
+        if not isinstance(field, str):
+            continue
+        if "编号" in field or "num" in field.lower() or "id" in field.lower():
+            return field
+    return None
+
+
+# docxtpl除正文、页眉、页脚外还会渲染的文档属性
+_RENDERED_CORE_PROPERTIES = ("author", "comments", "identifier", "language", "subject", "title")
+_FOOTNOTES_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.footnotes+xml"
+
+
+def extra_template_variables(doc):
+    """返回脚注和文档属性中的占位符
+
+    docxtpl渲染时也会替换这两部分，但 get_undeclared_template_variables 只扫描正文、页眉和页脚，
+    裁剪列时需要把这里的占位符一并保留。doc为已调用 init_docx 的DocxTemplate。
+    """
+    from jinja2 import Environment, meta
+    
+    sources = []
+    for part in doc.docx.part.package.parts:
+        if part.content_type == _FOOTNOTES_CONTENT_TYPE:
+            blob = part.blob
+            xml = blob.decode("utf-8") if isinstance(blob, bytes) else blob
+            if "{" in xml:
+                sources.append(doc.patch_xml(xml))
+    for prop in _RENDERED_CORE_PROPERTIES:
+        value = getattr(doc.docx.core_properties, prop)
+        if value and "{" in value:
+            sources.append(value)
+    
+    env = Environment()
+    variables = set()
+    for source in sources:
+        variables.update(meta.find_undeclared_variables(env.parse(source)))
+    return variables
+
+
+def required_columns(columns, folder_field, file_field, template_mapping, template_variables):
+    """返回生成文档实际用到的列（保持原有顺序）
+
+    包括文件夹/文件名字段、模板映射的匹配字段、"编号"的来源列以及模板中的全部占位符，
+    其余列不参与生成，转换前即可丢弃。
+    """
+    required = {folder_field, file_field}
+    required.update(template_variables)
+    if template_mapping:
+        required.update(field for field in template_mapping if field != "__priority__")
+    number_source_key = _find_number_source_key(columns)
+    if number_source_key:
+        required.add(number_source_key)
+    return [col for col in columns if col in required]
+
+
+def _select_template(row_dict, resolved_fields, default_template_path):
+    """根据预先计算的字段列表为一行数据选择模板路径"""
+    for field, field_alias, mapping in resolved_fields:
+        value = str(row_dict.get(field, "") or row_dict.get(field_alias, "")).strip()
+        if value in mapping:
+            return mapping[value]
+    return default_template_path
+
+
+def _collect_valid_templates(word_template_path, template_mapping):
+    """收集基础模板和映射模板中存在且可读的模板，并一次性读入模板内容
+
+    Returns:
+        dict: {模板路径: 模板文件字节}，之后解析模板直接使用内存中的内容，不再重复打开文件
+    """
+    template_paths_to_check = set([word_template_path])
+    if template_mapping:
+        for mapping in template_mapping.values():
+            if isinstance(mapping, dict):
+                template_paths_to_check.update(mapping.values())
+    
+    valid_templates = {}
+    for tp in template_paths_to_check:
+        if tp and os.path.exists(tp) and os.access(tp, os.R_OK):
+            try:
+                with open(tp, 'rb') as f:
+                    valid_templates[tp] = f.read()
+            except OSError as e:
+                logger.warning(f"读取模板失败: {tp} - {str(e)}")
+    return valid_templates
+
+
+def _compile_fast_template(template_bytes):
+    """检查模板是否只包含简单的 {{ 变量 }} 替换，是则预先拆分为可直接拼接的片段
+
+    只有正文、页眉、页脚中的占位符全部是完整的 {{ 变量 }}（没有被Word拆分到多个run、
+    没有控制语句、过滤器或表达式）时才走快速路径，否则返回None，由docxtpl渲染。
+    不含占位符的部件预先压缩打包一次，每行只追加需要渲染的部件。
+
+    Returns:
+        tuple: (static_zip_bytes, [(ZipInfo, segments), ...])，segments为交替的文本/变量名片段；
+        或None表示不能使用快速路径
+    """
+    static_buffer = io.BytesIO()
+    rendered_parts = []
+    with zipfile.ZipFile(io.BytesIO(template_bytes)) as zin, \
+            zipfile.ZipFile(static_buffer, 'w', zipfile.ZIP_DEFLATED) as zstatic:
+        for info in zin.infolist():
+            data = zin.read(info.filename)
+            if b'{{' not in data and b'{%' not in data and b'{#' not in data:
+                zstatic.writestr(info, data, compress_type=zipfile.ZIP_DEFLATED)
+                continue
+            if not _FAST_TEMPLATE_PART_RE.match(info.filename):
+                return None
+            if b'{%' in data or b'{#' in data:
+                return None
+            xml = _PRESERVE_SPACE_RE.sub(r'<w:t xml:space="preserve">\1\2', data.decode('utf-8'))
+            segments = _SIMPLE_PLACEHOLDER_RE.split(xml)
+            placeholder_count = len(segments) // 2
+            if xml.count('{{') != placeholder_count or xml.count('}}') != placeholder_count:
+                return None
+            rendered_parts.append((info, segments))
+    return static_buffer.getvalue(), rendered_parts
+
+
+def _render_fast_template(fast_template, context, compress_output):
+    """按预先拆分的片段直接拼接生成文档，跳过docxtpl的XML解析和Jinja渲染
+
+    替换的值中含有换行、制表符等控制字符时返回None，由docxtpl渲染（拆分为对应的run或丢弃
+    XML不允许的字符），保证两条路径生成的文档一致。
+    """
+    static_zip_bytes, rendered_parts = fast_template
+    rendered_xml = []
+    for info, segments in rendered_parts:
+        parts = list(segments)
+        for i in range(1, len(parts), 2):
+            value = context.get(parts[i], "")
+            if _FAST_PATH_UNSAFE_CHARS_RE.search(value):
+                return None
+            parts[i] = xml_escape(value, {'"': '&quot;'})
+        rendered_xml.append((info, ''.join(parts)))
+    
+    compress_type = zipfile.ZIP_DEFLATED if compress_output else zipfile.ZIP_STORED
+    buffer = io.BytesIO(static_zip_bytes)
+    with zipfile.ZipFile(buffer, 'a') as zout:
+        for info, xml in rendered_xml:
+            zout.writestr(zipfile.ZipInfo(info.filename, info.date_time),
+                          xml.encode('utf-8'), compress_type=compress_type)
+    return buffer.getbuffer()
+
+
+def _cache_template(template_path, template_cache, known_variables=None, template_bytes=None):
+    """读取并解析模板，存入缓存
+
+    Args:
+        known_variables: 调用方已解析好的 {模板路径: 占位符集合}，命中时不再重复扫描占位符
+        template_bytes: 已读入内存的模板内容，为None时从文件读取
+    """
+    from docxtpl import DocxTemplate
+    
+    if template_bytes is None:
+        with open(template_path, 'rb') as f:
+            template_bytes = f.read()
+    doc = DocxTemplate(io.BytesIO(template_bytes))
+    doc.init_docx()
+    if known_variables and template_path in known_variables:
+        template_variables = set(known_variables[template_path])
+    else:
+        try:
+            template_variables = doc.get_undeclared_template_variables()
+        except Exception as e:
+            logger.warning(f"无法解析模板占位符: {template_path} - {str(e)}")
+            template_variables = None
+    try:
+        fast_template = _compile_fast_template(template_bytes)
+    except Exception:
+        fast_template = None
+    template_cache[template_path] = {
+        'docx': doc.docx,
+        'doc': doc,
+        'variables': template_variables,
+        'fast_template': fast_template,
+    }
 
 
 def _load_template_from_cache(template_path, template_cache):
-    """从缓存加载模板（进程内私有缓存）"""
+    """从缓存加载模板（进程内私有缓存）
+
+    缓存中保存已解析的文档对象和一个可复用的DocxTemplate实例，每次只深拷贝
+    已解析的文档并重置实例状态，避免每行重新解压zip、解析XML和创建模板对象。
+    调用方需在下次加载同一模板前完成上一份文档的保存。
+    """
     if template_path not in template_cache:
-        with open(template_path, 'rb') as f:
-            template_cache[template_path] = f.read()
-    template_bytes = template_cache[template_path]
-    return DocxTemplate(io.BytesIO(template_bytes))
+        _cache_template(template_path, template_cache)
+    cached = template_cache[template_path]
+    doc = cached['doc']
+    doc.reset_replacements()
+    doc.docx = copy.deepcopy(cached['docx'])
+    doc.is_rendered = False
+    doc.is_saved = False
+    return doc
 
 
-def _worker_process_chunk(args):
-    """Worker函数：处理一批文档（每个进程独立执行）
+def _find_missing_placeholders(template_path, template_cache, context):
+    """返回模板中在context里不存在的占位符（模板占位符集合只解析一次并缓存）"""
+    if template_path not in template_cache:
+        _cache_template(template_path, template_cache)
+    template_variables = template_cache[template_path]['variables']
+    if not template_variables:
+        return set()
+    return template_variables.difference(context)
+
+
+def _render_document(template_path, template_cache, context, compress_output=True):
+    """渲染文档并序列化到内存
+
+    简单替换模板直接拼接预先拆分的XML片段，其余模板（以及值中含控制字符的行）由docxtpl渲染。
+    两条路径都会对值做XML转义，值中含有 & 或 < 时不会因生成非法XML而失败。
+    compress_output为False时快速路径不压缩渲染后的部件（docxtpl路径由python-docx固定使用deflate）。
+
+    Returns:
+        文档的二进制内容
+    """
+    if template_path not in template_cache:
+        _cache_template(template_path, template_cache)
+    fast_template = template_cache[template_path]['fast_template']
+    if fast_template is not None:
+        data = _render_fast_template(fast_template, context, compress_output)
+        if data is not None:
+            return data
+    
+    doc = _load_template_from_cache(template_path, template_cache)
+    doc.render(context, autoescape=True)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getbuffer()
+
+
+class _WorkerState(threading.local):
+    """工作进程内的共享状态，由 _init_worker 在进程启动时填充一次
+
+    基于threading.local：自由线程模式下以线程池代替进程池时，每个工作线程各有一份独立状态。
+    """
+
+    def __init__(self):
+        self._values = {}
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __setitem__(self, key, value):
+        self._values[key] = value
+
+    def clear(self):
+        self._values.clear()
+
+    def update(self, values):
+        self._values.update(values)
+
+
+_worker_state = _WorkerState()
+
+
+def _free_threading_enabled():
+    """当前解释器是否为已关闭GIL的自由线程版本（Python 3.13t及以上）"""
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+def _init_worker(config, error_queue):
+    """工作进程初始化函数：保存共享配置（每个进程只执行一次）
     
     Args:
-        args: dict containing:
-            - chunk_data: list of (index, row_dict) tuples
+        config: dict containing:
             - folder_field: 文件夹名字段
             - file_field: 文件名字段
             - ignore_missing: 是否忽略缺失占位符
             - output_path: 输出路径
-            - word_template_path: 基础模板路径
-            - template_mapping: 模板映射配置
-            - chunk_start_idx: 这批数据的起始索引
+            - compress_output: 是否压缩输出文档
+            - template_variables: 已解析的模板占位符 {模板路径: 占位符集合}，可为None
+            - valid_templates: 主进程读入的可用模板 {模板路径: 模板文件字节}
+            - rows_shm_name: 存放序列化数据块的共享内存名称
+        error_queue: 向主进程实时上报错误信息的队列
+    """
+    _worker_state.clear()
+    _worker_state.update(config)
+    _worker_state['error_queue'] = error_queue
+    _worker_state['rows_shm'] = shared_memory.SharedMemory(name=config['rows_shm_name'])
+    
+    folder_field = config['folder_field']
+    file_field = config['file_field']
+    
+    _worker_state.update({
+        # 进程内私有模板缓存：数据块按模板分组，只在第一次处理某个模板的数据块时解析该模板
+        'template_cache': {},
+        'folder_index': {},  # 进程内已占用文件名索引
+        'folder_paths': {},  # 文件夹名到完整路径的缓存
+        'output_prefix': os.path.join(config['output_path'], ''),
+        'folder_field_alias': folder_field.replace(" ", "_"),
+        'file_field_alias': file_field.replace(" ", "_"),
+        # 文档写入线程池：写文件时释放GIL，与主线程的渲染重叠进行
+        'writer': ThreadPoolExecutor(max_workers=_WRITER_THREADS),
+    })
+
+
+def _report_worker_error(message):
+    """工作进程中上报错误信息"""
+    _worker_state['error_queue'].put(message)
+
+
+def _drain_error_queue(error_queue, error_messages):
+    """主进程后台线程：持续接收工作进程上报的错误信息，收到None时结束"""
+    while True:
+        message = error_queue.get()
+        if message is None:
+            break
+        error_messages.append(message)
+
+
+def _worker_process_chunk(chunk_offset, chunk_length, chunk_start_idx):
+    """Worker函数：处理一批文档（每个进程独立执行）
+    
+    共享配置由 _init_worker 在进程启动时传入，本批数据从共享内存中读取，
+    任务本身只携带数据在共享内存中的位置。同一批数据使用同一个模板（由主进程分组），
+    输出文件名也已由主进程按行顺序预留。
+    错误信息在发生时立即通过错误队列发送给主进程，不随结果一起返回。
+    
+    Args:
+        chunk_offset: 本批数据在共享内存中的起始偏移
+        chunk_length: 本批数据序列化后的字节数
+        chunk_start_idx: 这批数据的起始索引
             
     Returns:
-        dict: success_count, error_messages, chunk_start_idx, elapsed_time
+        dict: success_count, chunk_start_idx, elapsed_time
     """
-    chunk_data = args['chunk_data']
-    folder_field = args['folder_field']
-    file_field = args['file_field']
-    ignore_missing = args['ignore_missing']
-    output_path = args['output_path']
-    word_template_path = args['word_template_path']
-    template_mapping = args['template_mapping']
-    chunk_start_idx = args['chunk_start_idx']
+    folder_field = _worker_state['folder_field']
+    file_field = _worker_state['file_field']
+    ignore_missing = _worker_state['ignore_missing']
+    compress_output = _worker_state['compress_output']
+    output_prefix = _worker_state['output_prefix']
+    valid_templates = _worker_state['valid_templates']
+    template_cache = _worker_state['template_cache']
+    folder_index = _worker_state['folder_index']
+    folder_paths = _worker_state['folder_paths']
+    folder_field_alias = _worker_state['folder_field_alias']
+    file_field_alias = _worker_state['file_field_alias']
+    writer = _worker_state['writer']
     
     successful_count = 0
-    error_messages = []
+    pending_writes = []
     start_time = time.time()
     
-    # 验证模板文件
-    valid_templates = {}
-    template_paths_to_check = set([word_template_path])
-    if template_mapping:
-        for mapping in template_mapping.values():
-            if isinstance(mapping, dict):
-                template_paths_to_check.update(mapping.values())
+    # 从共享内存读取本批数据: (template_path, list of (index, row_dict, file_path) tuples)
+    with _worker_state['rows_shm'].buf[chunk_offset:chunk_offset + chunk_length] as chunk_view:
+        template_path, chunk_data = pickle.loads(chunk_view)
     
-    for tp in template_paths_to_check:
-        if tp and os.path.exists(tp) and os.access(tp, os.R_OK):
-            valid_templates[tp] = True
+    if not template_path or template_path not in valid_templates:
+        for idx, _, _ in chunk_data:
+            if not template_path:
+                _report_worker_error(f"第 {idx} 行: 未设置Word模板")
+            else:
+                _report_worker_error(f"第 {idx} 行: 模板文件不可用: {template_path}")
+        return {
+            'success_count': 0,
+            'chunk_start_idx': chunk_start_idx,
+            'elapsed_time': time.time() - start_time
+        }
     
-    # 进程内私有模板缓存
-    template_cache = {}
+    if template_path not in template_cache:
+        try:
+            _cache_template(template_path, template_cache, _worker_state['template_variables'],
+                            valid_templates[template_path])
+        except Exception as e:
+            logger.warning(f"加载模板失败: {template_path} - {str(e)}")
+    
+    number_source_key = _find_number_source_key(chunk_data[0][1].keys()) if chunk_data else None
     
-    for idx, row_dict in chunk_data:
+    for idx, row_dict, file_path in chunk_data:
         try:
-            folder_value = row_dict.get(folder_field, "") or row_dict.get(folder_field.replace(" ", "_"), "")
-            file_value = row_dict.get(file_field, "") or row_dict.get(file_field.replace(" ", "_"), "")
+            folder_value = row_dict.get(folder_field, "") or row_dict.get(folder_field_alias, "")
+            file_value = row_dict.get(file_field, "") or row_dict.get(file_field_alias, "")
             folder_name = _sanitize_filename(folder_value, f"文件夹_{idx}")
             file_name = _sanitize_filename(file_value, f"文件_{idx}")
             
-            folder_path = os.path.join(output_path, folder_name)
-            output_file = os.path.join(folder_path, f"{file_name}.docx")
-            output_file = _unique_file_path(output_file)
-            
-            # 确定模板路径
-            template_path = word_template_path
-            if template_mapping:
-                try:
-                    if "__priority__" in template_mapping:
-                        priority_fields = template_mapping["__priority__"]
-                        for field in priority_fields:
-                            if field in template_mapping:
-                                mapping = template_mapping[field]
-                                value = str(row_dict.get(field, "") or row_dict.get(field.replace(" ", "_"), "")).strip()
-                                if value in mapping:
-                                    template_path = mapping[value]
-                                    break
-                    else:
-                        for field, mapping in template_mapping.items():
-                            value = str(row_dict.get(field, "") or row_dict.get(field.replace(" ", "_"), "")).strip()
-                            if value in mapping:
-                                template_path = mapping[value]
-                                break
-                except Exception as e:
-                    error_messages.append(f"第 {idx} 行: 选择模板失败: {str(e)}")
-                    continue
-            
-            if not template_path or template_path not in valid_templates:
-                if not template_path:
-                    error_messages.append(f"第 {idx} 行: 未设置Word模板")
-                else:
-                    error_messages.append(f"第 {idx} 行: 模板文件不可用: {template_path}")
-                continue
+            folder_path = _get_folder_path(folder_name, output_prefix, folder_paths)
             
             # 加载并渲染模板
             try:
-                doc = _load_template_from_cache(template_path, template_cache)
-                
-                context = {}
-                first_row_keys = list(row_dict.keys())
-                
-                for col in first_row_keys:
-                    try:
-                        value = row_dict.get(col, "")
-                        if isinstance(value, float) and value.is_integer():
-                            value = int(value)
-                        context[col] = str(value)
-                    except Exception:
-                        context[col] = ""
+                context = {col: _cell_to_str(value) for col, value in row_dict.items()}
                 
                 # 处理"编号"字段
-                number_field_found = False
-                for col in list(context.keys()):
-                    if col == "编号" or col == "编号".lower() or col == "编号".replace(" ", "_"):
-                        if "编号" not in context:
-                            context["编号"] = context[col]
-                        number_field_found = True
-                        break
+                context["编号"] = context.get(number_source_key, "") if number_source_key else ""
                 
-                if not number_field_found:
-                    for field in first_row_keys:
-                        if "编号" in field or "num" in field.lower() or "id" in field.lower():
-                            value = row_dict.get(field, "")
-                            if isinstance(value, float) and value.is_integer():
-                                value = int(value)
-                            context["编号"] = str(value)
-                            break
-                
-                if "编号" not in context:
-                    context["编号"] = ""
-                
-                # 渲染文档
-                try:
-                    doc.render(context)
-                except Exception as e:
-                    if "not found in context" in str(e) or "context has no attribute" in str(e):
-                        if ignore_missing:
-                            doc.render(context, missing_tags='keep')
-                        else:
-                            error_messages.append(f"第 {idx} 行: 占位符缺失: {str(e)}")
-                            continue
-                    else:
-                        raise
+                # 渲染前检查缺失的占位符，避免无效渲染
+                if not ignore_missing:
+                    missing = _find_missing_placeholders(template_path, template_cache, context)
+                    if missing:
+                        _report_worker_error(f"第 {idx} 行: 占位符缺失: {', '.join(sorted(missing))}")
+                        continue
                 
-                doc.save(output_file)
-                successful_count += 1
+                # 渲染文档，写入主进程预留的文件名，交给写入线程后主线程继续渲染下一份
+                data = _render_document(template_path, template_cache, context, compress_output)
+                pending_writes.append((idx, writer.submit(
+                    _write_reserved_file, folder_path, f"{file_name}.docx", file_path, data, folder_index)))
                 
             except Exception as e:
-                error_messages.append(f"第 {idx} 行: 生成文档失败: {str(e)}")
+                _report_worker_error(f"第 {idx} 行: 生成文档失败: {str(e)}")
                 
         except Exception as e:
-            error_messages.append(f"第 {idx} 行: 处理失败: {str(e)}")
+            _report_worker_error(f"第 {idx} 行: 处理失败: {str(e)}")
+    
+    # 等待本批文档全部写入完成
+    for idx, future in pending_writes:
+        try:
+            future.result()
+            successful_count += 1
+        except Exception as e:
+            _report_worker_error(f"第 {idx} 行: 生成文档失败: {str(e)}")
     
     elapsed_time = time.time() - start_time
     
     return {
         'success_count': successful_count,
-        'error_messages': error_messages,
         'chunk_start_idx': chunk_start_idx,
         'elapsed_time': elapsed_time
     }
@@ -207,7 +617,8 @@ class DocumentGenerator:
     
     def generate(self, rows, folder_field, file_field, ignore_missing, output_path, 
                  word_template_path, template_mapping, cancel_event, progress_cb,
-                 use_multiprocessing=True, max_workers=None):
+                 use_multiprocessing=True, max_workers=None, compress_output=False,
+                 template_variables=None):
         """
         生成文档的核心方法
         
@@ -223,6 +634,9 @@ class DocumentGenerator:
             progress_cb: 进度回调函数 (progress, message)
             use_multiprocessing: 是否使用多进程（默认True）
             max_workers: 最大进程数，默认CPU核心数
+            compress_output: 是否压缩渲染后的文档部件（默认False，以少量体积换取生成速度）
+            template_variables: 调用方已解析的模板占位符 {模板路径: 占位符集合}，
+                传入后生成时不再重复扫描这些模板的占位符
             
         Returns:
             tuple: (success_count, error_messages, exception)
@@ -243,19 +657,8 @@ class DocumentGenerator:
                 logger.error(error_msg)
                 return 0, [error_msg], None
             
-            # 收集所有模板路径用于验证
-            template_paths_to_check = set()
-            template_paths_to_check.add(word_template_path)
-            if template_mapping:
-                for mapping in template_mapping.values():
-                    if isinstance(mapping, dict):
-                        template_paths_to_check.update(mapping.values())
-            
             # 预检查所有模板文件
-            valid_templates = {}
-            for tp in template_paths_to_check:
-                if tp and os.path.exists(tp) and os.access(tp, os.R_OK):
-                    valid_templates[tp] = True
+            valid_templates = _collect_valid_templates(word_template_path, template_mapping)
             
             if not valid_templates:
                 error_msg = "没有可用的模板文件"
@@ -272,11 +675,17 @@ class DocumentGenerator:
                 folder_name = _sanitize_filename(folder_value, f"文件夹_{idx}")
                 folders_to_create.add(os.path.join(output_path, folder_name))
             
-            # 批量创建文件夹
+            # 批量创建文件夹（先确保输出目录存在，子文件夹只需一次mkdir）
             logger.info(f"开始批量创建 {len(folders_to_create)} 个文件夹")
+            try:
+                os.makedirs(output_path, exist_ok=True)
+            except Exception as e:
+                logger.error(f"创建输出目录失败: {output_path} - {str(e)}")
             for folder_path in folders_to_create:
                 try:
-                    os.makedirs(folder_path, exist_ok=True)
+                    os.mkdir(folder_path)
+                except FileExistsError:
+                    pass
                 except Exception as e:
                     logger.error(f"创建文件夹失败: {folder_path} - {str(e)}")
             
@@ -285,7 +694,8 @@ class DocumentGenerator:
                 successful_count, error_messages = self._generate_single_process(
                     rows, folder_field, file_field, ignore_missing, output_path,
                     word_template_path, template_mapping, valid_templates,
-                    cancel_event, progress_cb, total_rows, start_time
+                    cancel_event, progress_cb, total_rows, start_time, compress_output,
+                    template_variables
                 )
                 return successful_count, error_messages, None
             
@@ -293,7 +703,8 @@ class DocumentGenerator:
             return self._generate_multiprocess(
                 rows, folder_field, file_field, ignore_missing, output_path,
                 word_template_path, template_mapping, valid_templates,
-                cancel_event, progress_cb, total_rows, start_time, max_workers
+                cancel_event, progress_cb, total_rows, start_time, max_workers, compress_output,
+                template_variables
             )
             
         except Exception as e:
@@ -302,30 +713,53 @@ class DocumentGenerator:
     
     def _generate_single_process(self, rows, folder_field, file_field, ignore_missing, output_path,
                                   word_template_path, template_mapping, valid_templates,
-                                  cancel_event, progress_cb, total_rows, start_time):
+                                  cancel_event, progress_cb, total_rows, start_time, compress_output,
+                                  template_variables):
         """单进程生成"""
         successful_count = 0
         error_messages = []
         template_cache = {}
+        for tp in valid_templates:
+            try:
+                _cache_template(tp, template_cache, template_variables, valid_templates[tp])
+            except Exception as e:
+                logger.warning(f"预加载模板失败: {tp} - {str(e)}")
+        folder_index = {}
+        folder_paths = {}
+        output_prefix = os.path.join(output_path, '')
+        resolved_fields = _resolve_template_fields(template_mapping)
+        number_source_key = _find_number_source_key(rows[0].keys())
+        pending_writes = []
         
-        for idx, row_dict in enumerate(rows, start=1):
-            if cancel_event.is_set():
-                logger.info(f"文档生成已被取消")
-                break
-            
-            if idx % 10 == 0 or idx == total_rows:
-                progress = int(idx / total_rows * 100)
-                progress_cb(progress, f"正在生成第 {idx}/{total_rows} 个文档...")
-            
-            result = self._process_single_document(
-                idx, row_dict, folder_field, file_field, ignore_missing, output_path,
-                word_template_path, template_mapping, valid_templates, template_cache
-            )
+        # 与工作进程相同：渲染在当前线程进行，写文件交给写入线程，磁盘写入与下一份文档的渲染重叠
+        with ThreadPoolExecutor(max_workers=_WRITER_THREADS) as writer:
+            for idx, row_dict in enumerate(rows, start=1):
+                if cancel_event.is_set():
+                    logger.info(f"文档生成已被取消")
+                    break
+                
+                if idx % 10 == 0 or idx == total_rows:
+                    progress = int(idx / total_rows * 100)
+                    progress_cb(progress, f"正在生成第 {idx}/{total_rows} 个文档...")
+                
+                result = self._process_single_document(
+                    idx, row_dict, folder_field, file_field, ignore_missing, output_prefix,
+                    word_template_path, resolved_fields, number_source_key, valid_templates,
+                    template_cache, folder_index, folder_paths, compress_output, writer
+                )
+                
+                if result['success']:
+                    pending_writes.append((idx, result['write']))
+                else:
+                    error_messages.extend(result['errors'])
             
-            if result['success']:
-                successful_count += 1
-            else:
-                error_messages.extend(result['errors'])
+            # 等待所有文档写入完成
+            for idx, future in pending_writes:
+                try:
+                    future.result()
+                    successful_count += 1
+                except Exception as e:
+                    error_messages.append(f"第 {idx} 行: {str(e)}")
         
         end_time = time.time()
         total_time = end_time - start_time
@@ -336,62 +770,127 @@ class DocumentGenerator:
     
     def _generate_multiprocess(self, rows, folder_field, file_field, ignore_missing, output_path,
                                 word_template_path, template_mapping, valid_templates,
-                                cancel_event, progress_cb, total_rows, start_time, max_workers):
+                                cancel_event, progress_cb, total_rows, start_time, max_workers,
+                                compress_output, template_variables):
         """多进程生成"""
         import multiprocessing
         
         # 计算进程数和每批大小
         if max_workers is None:
             max_workers = min(multiprocessing.cpu_count(), 8)  # 最多8个进程
-        chunk_size = max(50, total_rows // max_workers)
+        # 使用较小的批次，空闲进程可以持续从任务队列中领取剩余批次，避免慢批次拖尾
+        chunk_size = min(50, max(10, total_rows // (max_workers * 8)))
+        
+        successful_count = 0
+        error_messages = []
         
-        logger.info(f"使用 {max_workers} 个进程并行生成，每批 {chunk_size} 个文档")
+        # 按模板对数据行分组，每批数据只使用一个模板，工作进程只需解析自己用到的模板。
+        # 分组前按行顺序预留输出文件名，同名文件的编号与单进程模式一致，不受分组和进程完成先后的影响
+        # （渲染失败的行预留的编号会空出）
+        resolved_fields = _resolve_template_fields(template_mapping)
+        template_groups = {}
+        folder_index = {}
+        folder_paths = {}
+        output_prefix = os.path.join(output_path, '')
+        folder_field_alias = folder_field.replace(" ", "_")
+        file_field_alias = file_field.replace(" ", "_")
+        for idx, row_dict in enumerate(rows, start=1):
+            try:
+                template_path = _select_template(row_dict, resolved_fields, word_template_path)
+            except Exception as e:
+                error_messages.append(f"第 {idx} 行: 选择模板失败: {str(e)}")
+                continue
+            file_path = None
+            if template_path in valid_templates:
+                folder_value = row_dict.get(folder_field, "") or row_dict.get(folder_field_alias, "")
+                file_value = row_dict.get(file_field, "") or row_dict.get(file_field_alias, "")
+                folder_path = _get_folder_path(_sanitize_filename(folder_value, f"文件夹_{idx}"),
+                                               output_prefix, folder_paths)
+                file_name = _sanitize_filename(file_value, f"文件_{idx}")
+                file_path = _reserve_file_path(folder_path, f"{file_name}.docx", folder_index)
+            template_groups.setdefault(template_path, []).append((idx, file_path))
         
-        # 准备数据块
+        # 准备数据块：每批序列化一次后连续写入共享内存，任务只传递偏移和长度
+        chunk_blobs = []
+        for template_path, reserved in template_groups.items():
+            for i in range(0, len(reserved), chunk_size):
+                chunk_data = [(idx, rows[idx-1], file_path) for idx, file_path in reserved[i:i+chunk_size]]
+                chunk_blobs.append((pickle.dumps((template_path, chunk_data), protocol=pickle.HIGHEST_PROTOCOL),
+                                    chunk_data[0][0]))
+        
+        rows_shm = shared_memory.SharedMemory(create=True, size=max(1, sum(len(blob) for blob, _ in chunk_blobs)))
         chunks = []
-        for i in range(0, total_rows, chunk_size):
-            chunk_data = [(idx, rows[idx-1]) for idx in range(i+1, min(i+chunk_size, total_rows)+1)]
-            chunks.append({
-                'chunk_data': chunk_data,
-                'folder_field': folder_field,
-                'file_field': file_field,
-                'ignore_missing': ignore_missing,
-                'output_path': output_path,
-                'word_template_path': word_template_path,
-                'template_mapping': template_mapping,
-                'chunk_start_idx': i + 1
-            })
+        offset = 0
+        for blob, chunk_start_idx in chunk_blobs:
+            rows_shm.buf[offset:offset + len(blob)] = blob
+            chunks.append((offset, len(blob), chunk_start_idx))
+            offset += len(blob)
+        del chunk_blobs
+        
+        # 自由线程版本的Python没有GIL，线程即可并行渲染，省去进程启动和数据序列化的开销
+        use_threads = _free_threading_enabled()
+        executor_class = ThreadPoolExecutor if use_threads else ProcessPoolExecutor
+        if use_threads:
+            logger.info("检测到自由线程Python，使用线程池代替进程池")
+        
+        # 批次数少于进程数时不多启动进程
+        max_workers = max(1, min(max_workers, len(chunks)))
+        worker_kind = "线程" if use_threads else "进程"
+        logger.info(f"使用 {max_workers} 个{worker_kind}并行生成，每批最多 {chunk_size} 个文档，共 {len(template_groups)} 个模板分组")
+        
+        # 共享配置只在进程启动时传递一次
+        worker_config = {
+            'folder_field': folder_field,
+            'file_field': file_field,
+            'ignore_missing': ignore_missing,
+            'output_path': output_path,
+            'compress_output': compress_output,
+            'template_variables': template_variables,
+            'valid_templates': valid_templates,
+            'rows_shm_name': rows_shm.name,
+        }
         
         # 使用进程池执行
-        successful_count = 0
-        error_messages = []
         completed = 0
         total_chunks = len(chunks)
         
-        with ProcessPoolExecutor(max_workers=max_workers) as executor:
-            futures = {executor.submit(_worker_process_chunk, chunk): chunk for chunk in chunks}
-            
-            for future in as_completed(futures):
-                if cancel_event.is_set():
-                    # 取消所有待执行的任务
-                    for f in futures:
-                        f.cancel()
-                    break
+        # 工作进程通过队列实时上报错误，由后台线程汇总，避免结果中携带大量错误信息
+        error_queue = queue.Queue() if use_threads else multiprocessing.Queue()
+        drain_thread = threading.Thread(target=_drain_error_queue, args=(error_queue, error_messages),
+                                        daemon=True)
+        drain_thread.start()
+        
+        try:
+            with executor_class(max_workers=max_workers, initializer=_init_worker,
+                                initargs=(worker_config, error_queue)) as executor:
+                futures = {executor.submit(_worker_process_chunk, chunk_offset, chunk_length, chunk_start_idx):
+                           chunk_start_idx for chunk_offset, chunk_length, chunk_start_idx in chunks}
                 
-                completed += 1
-                try:
-                    result = future.result()
-                    successful_count += result['success_count']
-                    error_messages.extend(result['error_messages'])
-                    
-                    # 更新进度
-                    progress = int(completed / total_chunks * 100)
-                    elapsed = result.get('elapsed_time', 0)
-                    progress_cb(progress, f"进程 {completed}/{total_chunks} 完成 (本批耗时 {elapsed:.1f}秒)")
+                for future in as_completed(futures):
+                    if cancel_event.is_set():
+                        # 取消所有待执行的任务，只等待正在执行的批次结束
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        break
                     
-                except Exception as e:
-                    logger.error(f"进程执行失败: {str(e)}")
-                    error_messages.append(f"进程执行失败: {str(e)}")
+                    completed += 1
+                    try:
+                        result = future.result()
+                        successful_count += result['success_count']
+                        
+                        # 更新进度
+                        progress = int(completed / total_chunks * 100)
+                        elapsed = result.get('elapsed_time', 0)
+                        progress_cb(progress, f"进程 {completed}/{total_chunks} 完成 (本批耗时 {elapsed:.1f}秒)")
+                        
+                    except Exception as e:
+                        logger.error(f"进程执行失败: {str(e)}")
+                        error_messages.append(f"进程执行失败: {str(e)}")
+        finally:
+            # 工作进程退出后队列中的错误都已送达，发送结束标记并等待汇总完成
+            error_queue.put(None)
+            drain_thread.join()
+            rows_shm.close()
+            rows_shm.unlink()
         
         end_time = time.time()
         total_time = end_time - start_time
@@ -401,93 +900,44 @@ class DocumentGenerator:
         return successful_count, error_messages, None
     
     def _process_single_document(self, idx, row_dict, folder_field, file_field, ignore_missing,
-                                  output_path, word_template_path, template_mapping,
-                                  valid_templates, template_cache):
-        """处理单个文档"""
+                                  output_prefix, word_template_path, resolved_fields, number_source_key,
+                                  valid_templates, template_cache, folder_index, folder_paths,
+                                  compress_output, writer):
+        """处理单个文档：渲染后把写文件任务提交给writer，成功时结果中的write为写入任务的Future"""
         try:
             folder_value = row_dict.get(folder_field, "") or row_dict.get(folder_field.replace(" ", "_"), "")
             file_value = row_dict.get(file_field, "") or row_dict.get(file_field.replace(" ", "_"), "")
             folder_name = _sanitize_filename(folder_value, f"文件夹_{idx}")
             file_name = _sanitize_filename(file_value, f"文件_{idx}")
             
-            folder_path = os.path.join(output_path, folder_name)
-            output_file = os.path.join(folder_path, f"{file_name}.docx")
-            output_file = _unique_file_path(output_file)
+            folder_path = _get_folder_path(folder_name, output_prefix, folder_paths)
             
             # 确定模板路径
-            template_path = word_template_path
-            if template_mapping:
-                try:
-                    if "__priority__" in template_mapping:
-                        for field in template_mapping["__priority__"]:
-                            if field in template_mapping:
-                                mapping = template_mapping[field]
-                                value = str(row_dict.get(field, "") or row_dict.get(field.replace(" ", "_"), "")).strip()
-                                if value in mapping:
-                                    template_path = mapping[value]
-                                    break
-                    else:
-                        for field, mapping in template_mapping.items():
-                            value = str(row_dict.get(field, "") or row_dict.get(field.replace(" ", "_"), "")).strip()
-                            if value in mapping:
-                                template_path = mapping[value]
-                                break
-                except Exception:
-                    pass
+            try:
+                template_path = _select_template(row_dict, resolved_fields, word_template_path)
+            except Exception:
+                template_path = word_template_path
             
             if not template_path or template_path not in valid_templates:
                 return {'success': False, 'errors': [f"第 {idx} 行: 模板不可用"]}
             
-            # 加载并渲染
-            doc = _load_template_from_cache(template_path, template_cache)
-            
-            context = {}
-            first_row_keys = list(row_dict.keys())
-            
-            for col in first_row_keys:
-                try:
-                    value = row_dict.get(col, "")
-                    if isinstance(value, float) and value.is_integer():
-                        value = int(value)
-                    context[col] = str(value)
-                except Exception:
-                    context[col] = ""
+            context = {col: _cell_to_str(value) for col, value in row_dict.items()}
             
             # 处理编号字段
-            number_field_found = False
-            for col in list(context.keys()):
-                if col == "编号" or col == "编号".lower():
-                    if "编号" not in context:
-                        context["编号"] = context[col]
-                    number_field_found = True
-                    break
-            
-            if not number_field_found:
-                for field in first_row_keys:
-                    if "编号" in field or "num" in field.lower() or "id" in field.lower():
-                        value = row_dict.get(field, "")
-                        if isinstance(value, float) and value.is_integer():
-                            value = int(value)
-                        context["编号"] = str(value)
-                        break
-            
-            if "编号" not in context:
-                context["编号"] = ""
-            
-            # 渲染
-            try:
-                doc.render(context)
-            except Exception as e:
-                if "not found in context" in str(e) or "context has no attribute" in str(e):
-                    if ignore_missing:
-                        doc.render(context, missing_tags='keep')
-                    else:
-                        return {'success': False, 'errors': [f"第 {idx} 行: 占位符缺失"]}
-                else:
-                    raise
-            
-            doc.save(output_file)
-            return {'success': True, 'errors': []}
+            context["编号"] = context.get(number_source_key, "") if number_source_key else ""
+            
+            # 渲染前检查缺失的占位符
+            if not ignore_missing:
+                missing = _find_missing_placeholders(template_path, template_cache, context)
+                if missing:
+                    return {'success': False, 'errors': [f"第 {idx} 行: 占位符缺失: {', '.join(sorted(missing))}"]}
+            
+            # 渲染后按行顺序预留文件名，再交给写入线程
+            data = _render_document(template_path, template_cache, context, compress_output)
+            file_path = _reserve_file_path(folder_path, f"{file_name}.docx", folder_index)
+            future = writer.submit(_write_reserved_file, folder_path, f"{file_name}.docx", file_path,
+                                   data, folder_index)
+            return {'success': True, 'errors': [], 'write': future}
             
         except Exception as e:
             return {'success': False, 'errors': [f"第 {idx} 行: {str(e)}"]}
@@ -1,12 +1,20 @@
 import json
 import os
+import subprocess
 import sys
 import threading
 import logging
 import copy
+import importlib.util
+import tempfile
 from functools import partial
+from types import MappingProxyType
 
-import pandas as pd
+try:
+    # 可选依赖：orjson读写配置文件比标准库json快数倍，未安装时回退到json
+    import orjson
+except ImportError:
+    orjson = None
 
 # 配置日志记录
 try:
@@ -31,18 +39,28 @@ except Exception as e:
     logger.warning(f"无法初始化日志文件: {str(e)}，仅使用控制台输出")
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QPushButton, QVBoxLayout, QFileDialog,
-    QLabel, QHBoxLayout, QWidget, QMessageBox, QScrollArea, QComboBox, QDialog, QGridLayout, QSplitter, QCheckBox, QLineEdit
+    QLabel, QHBoxLayout, QWidget, QMessageBox, QScrollArea, QComboBox, QDialog, QGridLayout, QSplitter, QCheckBox, QLineEdit,
+    QTableWidget, QTableWidgetItem, QAbstractItemView, QHeaderView
 )
-from docxtpl import DocxTemplate
-from PySide6.QtCore import Qt, QObject, Signal, QThread
+from PySide6.QtCore import Qt, QObject, Signal, QThread, QTimer, QRunnable, QThreadPool
+from PySide6.QtGui import QColor
+
+from document_generator import DocumentGenerator, dataframe_to_rows, extra_template_variables, required_columns
+
+# 模板占位符扫描结果的缓存文件，模板未修改时再次生成无需重新解析模板
+PLACEHOLDER_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".word_batch_generator_cache.json")
+
+# 进程的文件权限掩码：os.umask只能通过设置新值来读取，在启动时读取一次，不在后台写入线程中临时修改
+_UMASK = os.umask(0)
+os.umask(_UMASK)
 
 
 class DocumentGeneratorThread(QThread):
     """文档生成线程，继承自QThread"""
-    progress_updated = Signal(int, str)  # 进度值, 状态信息
     finished = Signal(bool, str)  # 是否成功, 结果信息
     
-    def __init__(self, parent, folder_field, file_field, ignore_missing, output_path, excel_data, word_template_path, template_mapping, cancel_event):
+    def __init__(self, parent, folder_field, file_field, ignore_missing, output_path, excel_data, word_template_path, template_mapping, cancel_event,
+                 placeholder_cache=None):
         super().__init__(parent)
         self.folder_field = folder_field
         self.file_field = file_field
@@ -52,27 +70,90 @@ class DocumentGeneratorThread(QThread):
         self.word_template_path = word_template_path
         self.template_mapping = template_mapping
         self.cancel_event = cancel_event
+        self.placeholder_cache = placeholder_cache if placeholder_cache is not None else {}
+        # 最新进度 (进度值, 状态信息)，整体替换元组，界面线程读取时不会读到一半的数据
+        self.latest_progress = (0, "")
+        self._template_placeholders = None
+        self._extra_placeholders = set()
+    
+    def _placeholders_for(self, template_path):
+        """返回模板的占位符集合，模板文件的修改时间和大小未变化时直接使用缓存结果
+        
+        Returns:
+            tuple: (正文、页眉、页脚中的占位符集合, 脚注和文档属性中的占位符集合)
+        """
+        stat = os.stat(template_path)
+        cached = self.placeholder_cache.get(template_path)
+        if (isinstance(cached, dict) and cached.get("mtime_ns") == stat.st_mtime_ns
+                and cached.get("size") == stat.st_size and "extra_variables" in cached):
+            return set(cached.get("variables", [])), set(cached["extra_variables"])
+        
+        from docxtpl import DocxTemplate
+        
+        doc = DocxTemplate(template_path)
+        doc.init_docx()
+        variables = doc.get_undeclared_template_variables()
+        extra_variables = extra_template_variables(doc)
+        self.placeholder_cache[template_path] = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "variables": sorted(variables),
+            "extra_variables": sorted(extra_variables),
+        }
+        return variables, extra_variables
+    
+    def _scan_template_placeholders(self):
+        """扫描基础模板和映射模板中的全部占位符，结果缓存在实例上
+        
+        每个模板只解析一次，结果同时用于列裁剪和传给生成器，生成时不再重复扫描。
+        脚注和文档属性中的占位符另存在 _extra_placeholders 中，只用于列裁剪。
+        
+        Returns:
+            dict: {模板路径: 占位符集合}；任一模板无法解析时返回None
+        """
+        if self._template_placeholders is None:
+            template_paths = {self.word_template_path}
+            for mapping in (self.template_mapping or {}).values():
+                if isinstance(mapping, dict):
+                    template_paths.update(mapping.values())
+            
+            placeholders = {}
+            extra_placeholders = set()
+            for template_path in template_paths:
+                if not template_path or not os.path.exists(template_path):
+                    continue
+                try:
+                    placeholders[template_path], extra_variables = self._placeholders_for(template_path)
+                except Exception as e:
+                    logger.warning(f"无法扫描模板占位符: {template_path} - {str(e)}")
+                    return None
+                extra_placeholders.update(extra_variables)
+            self._template_placeholders = placeholders
+            self._extra_placeholders = extra_placeholders
+        return self._template_placeholders
     
     def run(self):
         """线程执行的主函数，管理文档生成过程"""
-        import logging
-        import os
-        from document_generator import DocumentGenerator
-        
-        logger = logging.getLogger(__name__)
         logger.info("开始执行文档生成工作线程")
         
         try:
-            # 一次性将Excel数据转换为字典列表，提高遍历性能
-            # 避免在循环中反复使用 getattr / row.xxx
-            rows = [
-                row._asdict()
-                for row in self.excel_data.itertuples(index=False, name="Row")
-            ]
+            # 只保留生成文档需要的列（字段、映射字段和模板占位符），减少转换和传递的数据量
+            excel_data = self.excel_data
+            template_variables = self._scan_template_placeholders()
+            if template_variables is not None:
+                excel_data = excel_data.loc[:, required_columns(
+                    excel_data.columns.tolist(), self.folder_field, self.file_field,
+                    self.template_mapping,
+                    set().union(self._extra_placeholders, *template_variables.values())
+                )]
+            
+            # 一次性将Excel数据按列向量化转换为字符串字典列表，提高遍历性能
+            # 生成文档时无需再逐个单元格判断类型
+            rows = dataframe_to_rows(excel_data)
             
-            # 定义进度回调函数
+            # 定义进度回调函数：只记录最新进度，由界面线程的定时器定期读取，不发送信号
             def progress_callback(progress, message):
-                self.progress_updated.emit(progress, message)
+                self.latest_progress = (progress, message)
             
             # 创建DocumentGenerator实例
             generator = DocumentGenerator()
@@ -87,7 +168,8 @@ class DocumentGeneratorThread(QThread):
                 word_template_path=self.word_template_path,
                 template_mapping=self.template_mapping,
                 cancel_event=self.cancel_event,
-                progress_cb=progress_callback
+                progress_cb=progress_callback,
+                template_variables=template_variables
             )
             
             # 检查是否有致命异常
@@ -98,13 +180,6 @@ class DocumentGeneratorThread(QThread):
             
             # 处理生成结果
             if successful_count > 0:
-                try:
-                    # 打开输出文件夹
-                    os.startfile(self.output_path)
-                except Exception as e:
-                    # 忽略打开文件夹的错误，不影响生成结果
-                    logger.warning(f"无法打开输出文件夹: {str(e)}")
-                    
                 result_message = f"文档批量生成完成！\n成功生成: {successful_count} 个文档"
                 if error_messages:
                     result_message += f"\n\n错误详情:\n" + "\n".join(error_messages[:5])
@@ -143,6 +218,10 @@ class MainWindow(QMainWindow):
         self.excel_data = None
         self.template_mapping = {}
         self.cancel_event = threading.Event()  # 取消生成事件
+        
+        # 模板占位符缓存，跨多次生成和程序重启复用
+        success, result = self.load_config(PLACEHOLDER_CACHE_PATH)
+        self.placeholder_cache = result if success else {}
 
 
         # 初始化UI组件
@@ -194,14 +273,39 @@ class MainWindow(QMainWindow):
         self.progress_bar.setValue(0)
         self.progress_bar.setMaximum(100)
         self.progress_bar.setVisible(False)  # 默认隐藏
+        
+        # 生成期间定时读取生成线程的进度，代替每次进度变化都发送信号
+        self.progress_timer = QTimer(self)
+        self.progress_timer.setInterval(50)
+        self.progress_timer.timeout.connect(self._pump_progress)
 
-        # 初始化字段显示区域布局
-        self.fields_area = QScrollArea()
-        self.fields_widget = QWidget()
-        self.fields_layout = QVBoxLayout()
-        self.fields_widget.setLayout(self.fields_layout)
-        self.fields_area.setWidget(self.fields_widget)
-        self.fields_area.setWidgetResizable(True)
+        # 初始化字段显示区域：一个表格展示所有字段，不再为每个字段创建一组控件
+        self.fields_title_label = QLabel("字段名与替换关键词对应关系")
+        self.fields_title_label.setStyleSheet("font-weight: bold; font-size: 12pt; margin-bottom: 10px;")
+        self.fields_title_label.setVisible(False)
+        
+        self.fields_info_label = QLabel("请先导入Excel文件以查看字段信息")
+        self.fields_info_label.setAlignment(Qt.AlignCenter)
+        self.fields_info_label.setStyleSheet("color: #666666;")
+        self.fields_info_label.setVisible(False)
+        
+        self.fields_table = QTableWidget(0, 4)
+        self.fields_table.setHorizontalHeaderLabels(["字段名", "", "替换关键词", ""])
+        self.fields_table.verticalHeader().setVisible(False)
+        self.fields_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.fields_table.setSelectionMode(QAbstractItemView.NoSelection)
+        self.fields_table.setShowGrid(False)
+        header = self.fields_table.horizontalHeader()
+        header.setSectionResizeMode(0, QHeaderView.Interactive)
+        header.setSectionResizeMode(1, QHeaderView.Fixed)
+        header.setSectionResizeMode(2, QHeaderView.Stretch)
+        header.setSectionResizeMode(3, QHeaderView.Fixed)
+        self.fields_table.setColumnWidth(0, 150)
+        self.fields_table.setColumnWidth(1, 50)
+        self.fields_table.setColumnWidth(3, 60)
+        self.fields_table.cellClicked.connect(self.on_fields_table_clicked)
+        # 当前表格中已显示的字段，重新导入时只更新有变化的行
+        self._displayed_columns = []
         
     def setup_main_layout(self):
         """设置主窗口的布局结构"""
@@ -242,7 +346,9 @@ class MainWindow(QMainWindow):
         main_layout.addLayout(path_layout)
         main_layout.addLayout(field_layout)
         main_layout.addWidget(self.progress_bar)
-        main_layout.addWidget(self.fields_area)
+        main_layout.addWidget(self.fields_title_label)
+        main_layout.addWidget(self.fields_info_label)
+        main_layout.addWidget(self.fields_table)
         
         logger.info("主窗口布局设置完成")
         
@@ -276,7 +382,7 @@ class MainWindow(QMainWindow):
                 logger.info(f"选择了Excel文件: {file_path}")
                 
                 # 读取Excel文件数据，将所有列读取为字符串类型，保持原始格式
-                self.excel_data = pd.read_excel(file_path, dtype=str)
+                self.excel_data = self._read_excel(file_path)
                 self.excel_path = file_path
                 
                 # 更新路径标签
@@ -295,6 +401,29 @@ class MainWindow(QMainWindow):
                 logger.error(f"导入Excel文件失败: {str(e)}")
                 QMessageBox.critical(self, "错误", f"导入Excel文件失败: {str(e)}")
                 
+    def _read_excel(self, file_path):
+        """读取Excel文件，所有列按字符串读取
+        
+        安装了python-calamine且pandas版本不低于2.2（pandas从2.2起支持该引擎）时使用calamine引擎解析
+        （比openpyxl快数倍），否则使用pandas默认引擎。
+        安装了pyarrow时字符串列以Arrow格式存储，取唯一值等操作在Arrow的C++内核中完成。
+        重复值较多的列转换为分类类型，减少内存占用并加快取唯一值和逐行转换。
+        """
+        # pandas导入较慢，首次导入Excel时才加载，加快程序启动
+        import pandas as pd
+        
+        pandas_version = tuple(int(part) for part in pd.__version__.split(".")[:2])
+        engine = "calamine" if pandas_version >= (2, 2) and importlib.util.find_spec("python_calamine") else None
+        dtype = "string[pyarrow]" if importlib.util.find_spec("pyarrow") else str
+        data = pd.read_excel(file_path, dtype=dtype, engine=engine)
+        
+        row_count = len(data)
+        for col_pos in range(data.shape[1]):
+            series = data.iloc[:, col_pos]
+            if row_count and series.nunique(dropna=True) <= row_count // 2:
+                data.isetitem(col_pos, series.astype("category"))
+        return data
+    
     def update_field_combos(self):
         """更新文件夹名和文件名选择下拉框的选项"""
         if self.excel_data is not None:
@@ -315,67 +444,70 @@ class MainWindow(QMainWindow):
         """更新字段展示区域，显示所有字段名及其对应的替换关键词"""
         logger.info("更新字段展示区域")
         
-        # 清空当前的字段展示区域
-        for i in reversed(range(self.fields_layout.count())):
-            widget = self.fields_layout.itemAt(i).widget()
-            if widget is not None:
-                widget.deleteLater()
-        
         if self.excel_data is not None:
             # 获取Excel的列名
             columns = list(self.excel_data.columns)
             
-            # 创建标题标签
-            title_label = QLabel("字段名与替换关键词对应关系")
-            title_label.setStyleSheet("font-weight: bold; font-size: 12pt; margin-bottom: 10px;")
-            self.fields_layout.addWidget(title_label)
+            # 与已显示的字段比较，开头相同的行保持不变，只重新填充第一个不同字段之后的行
+            unchanged_count = 0
+            for old_column, new_column in zip(self._displayed_columns, columns):
+                if old_column != new_column:
+                    break
+                unchanged_count += 1
             
-            # 为每个字段创建显示控件
-            for column in columns:
-                # 创建字段显示控件
-                field_widget = QWidget()
-                field_layout = QHBoxLayout(field_widget)
-                field_layout.setContentsMargins(0, 5, 0, 5)
-                
-                # 创建字段名标签
-                field_name_label = QLabel(f"字段名: {column}")
-                field_name_label.setFixedWidth(150)
-                field_name_label.setStyleSheet("font-weight: bold;")
-                
-                # 创建箭头标签
-                arrow_label = QLabel("→")
-                arrow_label.setFixedWidth(50)
-                arrow_label.setAlignment(Qt.AlignCenter)
-                
-                # 创建替换关键词标签
-                replace_key_label = QLabel(f"替换关键词: {{{{{column}}}}}")
-                replace_key_label.setStyleSheet("color: #0066cc;")
-                
-                # 创建复制按钮
-                copy_btn = QPushButton("复制")
-                copy_btn.setFixedWidth(60)
-                copy_btn.clicked.connect(lambda checked, key=f"{{{{{column}}}}}": self.copy_to_clipboard(key))
-                
-                # 将控件添加到水平布局
-                field_layout.addWidget(field_name_label)
-                field_layout.addWidget(arrow_label)
-                field_layout.addWidget(replace_key_label)
-                field_layout.addWidget(copy_btn)
-                field_layout.addStretch()
-                
-                # 将水平布局控件添加到垂直布局
-                self.fields_layout.addWidget(field_widget)
+            # 批量填充表格，填充期间暂停重绘
+            self.fields_table.setUpdatesEnabled(False)
+            try:
+                self.fields_table.setRowCount(len(columns))
+                for row in range(unchanged_count, len(columns)):
+                    column = columns[row]
+                    field_name_item = QTableWidgetItem(str(column))
+                    font = field_name_item.font()
+                    font.setBold(True)
+                    field_name_item.setFont(font)
+                    
+                    arrow_item = QTableWidgetItem("→")
+                    arrow_item.setTextAlignment(Qt.AlignCenter)
+                    
+                    replace_key_item = QTableWidgetItem(f"{{{{{column}}}}}")
+                    replace_key_item.setForeground(QColor("#0066cc"))
+                    
+                    # 复制列：点击单元格即复制该行的替换关键词
+                    copy_item = QTableWidgetItem("复制")
+                    copy_item.setTextAlignment(Qt.AlignCenter)
+                    copy_item.setData(Qt.UserRole, replace_key_item.text())
+                    
+                    self.fields_table.setItem(row, 0, field_name_item)
+                    self.fields_table.setItem(row, 1, arrow_item)
+                    self.fields_table.setItem(row, 2, replace_key_item)
+                    self.fields_table.setItem(row, 3, copy_item)
+            finally:
+                self.fields_table.setUpdatesEnabled(True)
+            self._displayed_columns = columns
+            
+            self.fields_title_label.setVisible(True)
+            self.fields_info_label.setVisible(False)
+            self.fields_table.setVisible(True)
             
             logger.info(f"已在字段展示区域显示{len(columns)}个字段")
         else:
             # 如果没有导入Excel文件，显示提示信息
-            info_label = QLabel("请先导入Excel文件以查看字段信息")
-            info_label.setAlignment(Qt.AlignCenter)
-            info_label.setStyleSheet("color: #666666;")
-            self.fields_layout.addWidget(info_label)
+            self.fields_table.setRowCount(0)
+            self._displayed_columns = []
+            self.fields_title_label.setVisible(False)
+            self.fields_info_label.setVisible(True)
+            self.fields_table.setVisible(False)
             
             logger.info("未导入Excel文件，字段展示区域显示提示信息")
     
+    def on_fields_table_clicked(self, row, column):
+        """字段表格点击事件：点击"复制"列时复制该行的替换关键词"""
+        if column != 3:
+            return
+        copy_item = self.fields_table.item(row, 3)
+        if copy_item is not None:
+            self.copy_to_clipboard(copy_item.data(Qt.UserRole))
+    
     def copy_to_clipboard(self, text):
         """将文本复制到剪贴板"""
         clipboard = QApplication.clipboard()
@@ -530,11 +662,11 @@ class MainWindow(QMainWindow):
                 self.excel_data,
                 self.word_template_path,
                 self.template_mapping,
-                self.cancel_event
+                self.cancel_event,
+                self.placeholder_cache
             )
             
             # 连接线程信号
-            self.generator_thread.progress_updated.connect(self.on_progress_updated)
             self.generator_thread.finished.connect(self.on_generate_finished)
             
             # 显示进度条
@@ -545,8 +677,10 @@ class MainWindow(QMainWindow):
             self.batch_generate_btn.setEnabled(False)
             self.cancel_btn.setEnabled(True)
             
-            # 启动线程
+            # 启动线程，并由定时器以20Hz的频率刷新进度条
+            self._displayed_progress = None
             self.generator_thread.start()
+            self.progress_timer.start()
             
         except Exception as e:
             logger.error(f"批量生成文档失败: {str(e)}")
@@ -562,13 +696,22 @@ class MainWindow(QMainWindow):
         else:
             QMessageBox.information(self, "提示", "当前没有正在进行的生成任务")
             
+    def _pump_progress(self):
+        """定时器回调：读取生成线程的最新进度，有变化时刷新进度条"""
+        latest_progress = self.generator_thread.latest_progress
+        if latest_progress != self._displayed_progress:
+            self._displayed_progress = latest_progress
+            self.on_progress_updated(*latest_progress)
+    
     def on_progress_updated(self, progress, message):
-        """处理进度更新信号"""
+        """刷新进度条：由 _pump_progress 定时器（每50毫秒）读取生成线程的最新进度后调用，不经过信号"""
         self.progress_bar.setValue(progress)
-        logger.info(f"生成进度: {progress}% - {message}")
+        logger.debug("生成进度: %s%% - %s", progress, message)
         
     def on_generate_finished(self, success, message):
         """处理生成完成信号"""
+        self.progress_timer.stop()
+        
         # 重置进度条
         self.progress_bar.setValue(100)
         self.progress_bar.setVisible(False)
@@ -579,10 +722,36 @@ class MainWindow(QMainWindow):
         
         # 显示结果消息
         if success:
+            # 在主线程中打开输出文件夹，不阻塞生成线程结束
+            self._open_folder(self.output_path)
             QMessageBox.information(self, "成功", message)
         else:
             QMessageBox.critical(self, "错误", message)
     
+    def _open_folder(self, folder_path):
+        """用系统文件管理器打开文件夹，启动后立即返回，不等待文件管理器"""
+        if not folder_path:
+            return
+        try:
+            if sys.platform == "win32":
+                command = ["explorer", os.path.normpath(folder_path)]
+            elif sys.platform == "darwin":
+                command = ["open", folder_path]
+            else:
+                command = ["xdg-open", folder_path]
+            subprocess.Popen(command, close_fds=True)
+        except Exception as e:
+            # 忽略打开文件夹的错误，不影响生成结果
+            logger.warning(f"无法打开输出文件夹: {str(e)}")
+    
+    def closeEvent(self, event):
+        """关闭窗口时保存模板占位符缓存"""
+        if self.placeholder_cache:
+            success, message = self.save_config(self.placeholder_cache, PLACEHOLDER_CACHE_PATH)
+            if not success:
+                logger.warning(f"保存模板占位符缓存失败: {message}")
+        super().closeEvent(event)
+    
     def _select_file(self, caption, filter):
         """选择文件的辅助方法"""
         file_path, _ = QFileDialog.getOpenFileName(
@@ -605,13 +774,17 @@ class MainWindow(QMainWindow):
             if not os.access(config_path, os.R_OK):
                 return False, f"对配置文件没有读取权限: {config_path}"
                 
-            with open(config_path, "r", encoding="utf-8") as file:
-                config = json.load(file)
-                # 验证配置格式
-                if isinstance(config, dict):
-                    return True, config
-                else:
-                    return False, f"配置文件格式不正确: {config_path}"
+            if orjson is not None:
+                with open(config_path, "rb") as file:
+                    config = orjson.loads(file.read())
+            else:
+                with open(config_path, "r", encoding="utf-8") as file:
+                    config = json.load(file)
+            # 验证配置格式
+            if isinstance(config, dict):
+                return True, config
+            else:
+                return False, f"配置文件格式不正确: {config_path}"
         except json.JSONDecodeError as e:
             return False, f"配置文件格式错误，无法解析: {str(e)}"
         except UnicodeDecodeError:
@@ -619,8 +792,51 @@ class MainWindow(QMainWindow):
         except Exception as e:
             return False, f"加载配置文件时出错: {str(e)}"
     
-    def save_config(self, config, config_path=None):
-        """保存配置到文件，返回(success, message)元组"""
+    def _encode_config(self, config):
+        """将配置完整编码为UTF-8字节（优先使用orjson）"""
+        if orjson is not None:
+            return orjson.dumps(config, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        return json.dumps(config, ensure_ascii=False, indent=4).encode("utf-8")
+    
+    @staticmethod
+    def _write_config_file(config_path, data):
+        """直接通过文件描述符把编码好的配置字节写入文件，不经过Python的文件缓冲层
+        
+        先完整写入同目录下的临时文件并fsync一次，再用os.replace原子替换目标文件，
+        写入中途出错时原配置文件保持不变，不会留下写了一半的JSON。
+        临时文件名由mkstemp生成，后台同时导出到同一路径时各自写自己的临时文件，互不干扰。
+        """
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(config_path) + ".", suffix=".tmp",
+                                        dir=os.path.dirname(config_path) or ".")
+        try:
+            try:
+                if hasattr(os, "fchmod"):
+                    # mkstemp创建的文件仅所有者可读写：沿用原配置文件的权限，新文件按umask设置
+                    try:
+                        mode = os.stat(config_path).st_mode & 0o7777
+                    except OSError:
+                        mode = 0o666 & ~_UMASK
+                    os.fchmod(fd, mode)
+                view = memoryview(data)
+                while view:
+                    written = os.write(fd, view)
+                    view = view[written:]
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            os.replace(tmp_path, config_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+    
+    def save_config(self, config, config_path=None, data=None):
+        """保存配置到文件，返回(success, message)元组
+        
+        data为调用方已用 _encode_config 编码好的配置字节，传入时直接写入，不再重复编码。
+        """
         if config_path is None:
             config_path = "config.json"
         
@@ -638,9 +854,10 @@ class MainWindow(QMainWindow):
             if os.path.exists(config_path) and not os.access(config_path, os.W_OK):
                 return False, f"对配置文件没有写入权限: {config_path}"
                 
-            # 写入配置文件
-            with open(config_path, "w", encoding="utf-8") as file:
-                json.dump(config, file, ensure_ascii=False, indent=4)
+            # 先在内存中完整编码，再一次写入文件
+            if data is None:
+                data = self._encode_config(config)
+            self._write_config_file(config_path, data)
                 
             return True, f"配置已成功保存到 {config_path}"
         except IOError as e:
@@ -649,6 +866,27 @@ class MainWindow(QMainWindow):
             return False, f"保存配置文件时出错: {str(e)}"
             
 
+class SaveConfigSignals(QObject):
+    """后台保存配置任务的完成信号"""
+    finished = Signal(bool, str, str)  # 是否成功, 结果信息, 配置文件路径
+
+
+class SaveConfigTask(QRunnable):
+    """在线程池中写入已编码的配置文件，完成后通过信号通知界面线程"""
+    
+    def __init__(self, main_window, config, config_path, data):
+        super().__init__()
+        self.main_window = main_window
+        self.config = config
+        self.config_path = config_path
+        self.data = data
+        self.signals = SaveConfigSignals()
+    
+    def run(self):
+        success, message = self.main_window.save_config(self.config, self.config_path, self.data)
+        self.signals.finished.emit(success, message, self.config_path)
+
+
 class TemplateConfigDialog(QDialog):
     """模板配置对话框"""
     def __init__(self, excel_data, current_mapping, parent=None):
@@ -659,11 +897,45 @@ class TemplateConfigDialog(QDialog):
         self.excel_data = excel_data
         self.current_mapping = current_mapping or {}
         
-        # 用于存储所有字段的模板映射
-        self.field_template_mapping = copy.deepcopy(self.current_mapping)
+        # 用于存储所有字段的模板映射：只复制两层（字段 -> {值: 模板路径}），路径字符串不可变无需复制
+        self.field_template_mapping = {
+            field: dict(values) if isinstance(values, dict) else copy.copy(values)
+            for field, values in self.current_mapping.items()
+        }
+        # 与映射同步维护的可直接JSON编码的副本（模板路径统一为str），保存和导出时直接编码
+        self._serializable_mapping = self._to_serializable(self.field_template_mapping)
+        
+        # 各字段去重后的取值，切换字段时不再重复扫描整列
+        self._unique_cache = {}
+        # 映射的修改版本号，每次修改映射时加一；导出时版本未变则复用上次编码的结果
+        self._mapping_revision = 0
+        self._export_snapshot = None  # (版本号, 编码后的配置字节)
+        self._pending_exports = set()  # 正在后台写入的导出任务信号对象
+        # 每个选择按钮对应的模板路径标签 {按钮: QLabel}，字段值重复加载多行时各行只更新自己的标签
+        self._template_path_labels = {}
         
         self.init_ui()
         
+    @staticmethod
+    def _to_serializable(mapping):
+        """生成映射的可序列化副本，模板路径统一转为str"""
+        return {
+            field: {value: str(path) for value, path in values.items()} if isinstance(values, dict) else values
+            for field, values in mapping.items()
+        }
+    
+    def _set_field(self, field, value, path):
+        """设置字段值对应的模板路径，同时更新可序列化副本和修改版本号"""
+        self.field_template_mapping.setdefault(field, {})[value] = path
+        self._serializable_mapping.setdefault(field, {})[value] = str(path)
+        self._mapping_revision += 1
+    
+    def _replace_mapping(self, mapping):
+        """整体替换映射（加载/导入配置时），同时重建可序列化副本"""
+        self.field_template_mapping = mapping
+        self._serializable_mapping = self._to_serializable(mapping)
+        self._mapping_revision += 1
+    
     def init_ui(self):
         """初始化对话框UI"""
         layout = QVBoxLayout(self)
@@ -738,7 +1010,10 @@ class TemplateConfigDialog(QDialog):
             QMessageBox.warning(self, "字段错误", f"Excel 中不存在字段: {selected_field}")
             return
             
-        unique_values = self.excel_data[selected_field].dropna().unique()
+        unique_values = self._unique_cache.get(selected_field)
+        if unique_values is None:
+            unique_values = self.excel_data[selected_field].dropna().unique()
+            self._unique_cache[selected_field] = unique_values
         if len(unique_values) == 0:
             QMessageBox.information(self, "提示", f"字段 '{selected_field}' 没有可用值")
             return
@@ -751,31 +1026,11 @@ class TemplateConfigDialog(QDialog):
             # 如果已经有这个值的模板，显示模板路径
             select_path_label = QLabel(field_mapping.get(value, "未选择模板"))
 
-            def handle_choose_template(curr_field, curr_value, label):
-                try:
-                    path = self.parent()._select_file(
-                        f"选择字段 '{curr_field}' 值 '{curr_value}' 的模板",
-                        "Word 文件 (*.docx)"
-                    )
-                    if path:
-                        # 验证模板文件
-                        if not os.path.exists(path):
-                            QMessageBox.warning(self, "文件不存在", f"选择的模板文件不存在: {path}")
-                            return
-                            
-                        if not path.lower().endswith('.docx'):
-                            QMessageBox.warning(self, "文件格式错误", f"选择的文件不是有效的Word文档: {path}")
-                            return
-                            
-                        # 保存模板路径
-                        if curr_field not in self.field_template_mapping:
-                            self.field_template_mapping[curr_field] = {}
-                        self.field_template_mapping[curr_field][curr_value] = path
-                        label.setText(path)
-                except Exception as e:
-                    QMessageBox.critical(self, "选择模板错误", f"选择模板文件时出错: {str(e)}")
-
-            select_path_button.clicked.connect(lambda checked, f=selected_field, v=value, l=select_path_label: handle_choose_template(f, v, l))
+            # 所有按钮共用一个槽函数，字段和值保存在按钮属性中，不为每个值创建闭包
+            select_path_button.setProperty("template_field", selected_field)
+            select_path_button.setProperty("template_value", value)
+            select_path_button.clicked.connect(self._on_choose_template_clicked)
+            self._template_path_labels[select_path_button] = select_path_label
 
             value_layout_row.addWidget(value_label)
             value_layout_row.addStretch()
@@ -783,12 +1038,40 @@ class TemplateConfigDialog(QDialog):
             value_layout_row.addWidget(select_path_label)
             self.value_layout.addLayout(value_layout_row)
 
+    def _on_choose_template_clicked(self):
+        """选择模板路径按钮的槽函数，从发送信号的按钮属性中读取字段和值"""
+        button = self.sender()
+        curr_field = button.property("template_field")
+        curr_value = button.property("template_value")
+        try:
+            path = self.parent()._select_file(
+                f"选择字段 '{curr_field}' 值 '{curr_value}' 的模板",
+                "Word 文件 (*.docx)"
+            )
+            if path:
+                # 验证模板文件
+                if not os.path.exists(path):
+                    QMessageBox.warning(self, "文件不存在", f"选择的模板文件不存在: {path}")
+                    return
+                    
+                if not path.lower().endswith('.docx'):
+                    QMessageBox.warning(self, "文件格式错误", f"选择的文件不是有效的Word文档: {path}")
+                    return
+                    
+                # 保存模板路径
+                self._set_field(curr_field, curr_value, path)
+                label = self._template_path_labels.get(button)
+                if label is not None:
+                    label.setText(path)
+        except Exception as e:
+            QMessageBox.critical(self, "选择模板错误", f"选择模板文件时出错: {str(e)}")
+
     def load_config(self):
         """加载配置文件"""
         try:
             success, result = self.parent().load_config()
             if success:
-                self.field_template_mapping = result
+                self._replace_mapping(result)
                 QMessageBox.information(self, "提示", "配置文件加载成功！")
                 self.load_field_values()  # 刷新字段值显示
             else:
@@ -799,7 +1082,7 @@ class TemplateConfigDialog(QDialog):
     def save_config(self):
         """保存配置文件"""
         try:
-            success, message = self.parent().save_config(self.field_template_mapping)
+            success, message = self.parent().save_config(self._serializable_mapping)
             if success:
                 QMessageBox.information(self, "提示", f"配置已保存到 config.json！")
             else:
@@ -814,7 +1097,7 @@ class TemplateConfigDialog(QDialog):
             if config_path:
                 success, result = self.parent().load_config(config_path)
                 if success:
-                    self.field_template_mapping = result
+                    self._replace_mapping(result)
                     QMessageBox.information(self, "提示", "配置文件导入成功！")
                     self.load_field_values()
                 else:
@@ -825,24 +1108,43 @@ class TemplateConfigDialog(QDialog):
     def export_config(self):
         """导出配置文件"""
         try:
-            file_dialog = QFileDialog()
-            config_path, _ = file_dialog.getSaveFileName(
+            config_path, _ = QFileDialog.getSaveFileName(
                 self, "导出配置文件", "config_export.json", "JSON 文件 (*.json)"
             )
             if config_path:
                 if not config_path.lower().endswith('.json'):
                     config_path += '.json'
-                success, message = self.parent().save_config(self.field_template_mapping, config_path)
-                if success:
-                    QMessageBox.information(self, "提示", f"配置已导出到 {config_path}！")
-                else:
-                    QMessageBox.warning(self, "导出失败", message)
+                # 映射自上次导出后未修改时直接复用上次编码的结果
+                if self._export_snapshot is None or self._export_snapshot[0] != self._mapping_revision:
+                    self._export_snapshot = (
+                        self._mapping_revision,
+                        self.parent()._encode_config(self._serializable_mapping)
+                    )
+                
+                # 编码在界面线程完成，写文件交给线程池，慢速磁盘上也不会卡住界面
+                task = SaveConfigTask(self.parent(), self._serializable_mapping, config_path,
+                                      self._export_snapshot[1])
+                task.signals.finished.connect(self.on_export_finished)
+                self._pending_exports.add(task.signals)
+                QThreadPool.globalInstance().start(task)
         except Exception as e:
             QMessageBox.critical(self, "配置导出错误", f"导出配置文件时出错: {str(e)}")
 
+    def on_export_finished(self, success, message, config_path):
+        """后台导出完成后在界面线程显示结果"""
+        self._pending_exports.discard(self.sender())
+        if success:
+            QMessageBox.information(self, "提示", f"配置已导出到 {config_path}！")
+        else:
+            QMessageBox.warning(self, "导出失败", message)
+
     def get_mapping(self):
-        """获取配置的字段映射"""
-        return self.field_template_mapping
+        """获取配置的字段映射（只读视图）
+        
+        返回只读视图而不是副本，调用方不能增删字段；视图只读一层，各字段的 {值: 模板路径}
+        字典仍是对话框内的同一对象，调用方不应修改。再次打开对话框时会重新复制一份用于编辑。
+        """
+        return MappingProxyType(self.field_template_mapping)
 
 
 # 应用程序入口点
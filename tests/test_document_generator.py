@@ -0,0 +1,95 @@
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docx import Document
+from docx.oxml.ns import qn
+from docxtpl import DocxTemplate
+
+from document_generator import DocumentGenerator, _cache_template, _render_document
+
+# 首尾空格、制表符/换行等docxtpl会转换的字符、XML不允许的控制字符、需要转义的字符
+SAMPLE_VALUES = [
+    "张三",
+    "  张三  ",
+    " 前导空格",
+    "第一行\n第二行",
+    "a\tb",
+    "x\x0by",
+    "\x01控制\x1f字符",
+    "a & b < c > \"d\"",
+]
+
+
+def _document_content(data):
+    """用python-docx重新打开文档，返回各段落文本以及各文本节点的xml:space属性"""
+    document = Document(io.BytesIO(bytes(data)))
+    texts = [paragraph.text for paragraph in document.paragraphs]
+    spaces = [t.get(qn("xml:space")) for t in document.element.body.iter(qn("w:t"))]
+    return texts, spaces
+
+
+class FastTemplateTest(unittest.TestCase):
+    """快速替换路径与docxtpl渲染结果一致"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.template_path = os.path.join(self.temp_dir, "template.docx")
+        document = Document()
+        document.add_paragraph("姓名：{{ 姓名 }}")
+        document.add_paragraph("城市 {{ city }} 结束")
+        document.save(self.template_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _render_with_docxtpl(self, context):
+        doc = DocxTemplate(self.template_path)
+        doc.render(context, autoescape=True)
+        buffer = io.BytesIO()
+        doc.save(buffer)
+        return buffer.getvalue()
+
+    def test_template_uses_fast_path(self):
+        template_cache = {}
+        _cache_template(self.template_path, template_cache)
+        self.assertIsNotNone(template_cache[self.template_path]["fast_template"])
+
+    def test_fast_path_matches_docxtpl(self):
+        template_cache = {}
+        _cache_template(self.template_path, template_cache)
+        for value in SAMPLE_VALUES:
+            with self.subTest(value=value):
+                context = {"姓名": value, "city": value}
+                expected = _document_content(self._render_with_docxtpl(context))
+                for compress_output in (False, True):
+                    data = _render_document(self.template_path, template_cache, context, compress_output)
+                    self.assertEqual(_document_content(data), expected)
+
+    def test_generate_with_invalid_xml_characters(self):
+        output_path = os.path.join(self.temp_dir, "out")
+        rows = [{"目录": "d", "文件": f"f{i}", "姓名": value, "city": "  x  "}
+                for i, value in enumerate(SAMPLE_VALUES)]
+        success_count, error_messages, exception = DocumentGenerator().generate(
+            rows, "目录", "文件", False, output_path, self.template_path, {},
+            threading.Event(), lambda progress, message: None, use_multiprocessing=False
+        )
+        self.assertIsNone(exception)
+        self.assertEqual(error_messages, [])
+        self.assertEqual(success_count, len(rows))
+        for i, value in enumerate(SAMPLE_VALUES):
+            with self.subTest(value=value):
+                with open(os.path.join(output_path, "d", f"f{i}.docx"), "rb") as f:
+                    data = f.read()
+                expected = self._render_with_docxtpl({"目录": "d", "文件": f"f{i}", "姓名": value, "city": "  x  "})
+                self.assertEqual(_document_content(data), _document_content(expected))
+
+
+if __name__ == "__main__":
+    unittest.main()